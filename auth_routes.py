@@ -1,26 +1,67 @@
-import random
-from bson import ObjectId
-from fastapi import APIRouter, HTTPException, Request, status, Depends, Header
+import asyncio
+import hmac
+import secrets
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, status, Depends, Header
 from fastapi.responses import RedirectResponse
-from models import UserCreate, LoginRequest, ResetPasswordRequest
+from models import UserCreate, LoginRequest, ResetPasswordRequest, AuthResponse, ProfileUpdateResponse
 from database import users_collection
-from auth_utils import generate_access_token, hash_password, generate_temp_password, send_email, generate_oauth_state, get_current_user
+from http_client import get_http_client
+from auth_utils import generate_access_token, hash_password, verify_password, password_needs_rehash, hash_otp, generate_temp_password, send_email, verify_google_id_token, issue_oauth_state, consume_oauth_state, get_current_user
 import config
-import requests
 import httpx
+import orjson
 from urllib.parse import quote, urlencode
-from typing import Optional, Dict, Union
+from typing import Optional
 
 router = APIRouter()
 
+# OAuth authorize URLs with their static parameters encoded once; only state is appended per request
+_GOOGLE_AUTH_PREFIX = "https://accounts.google.com/o/oauth2/auth?" + urlencode({
+    "response_type": "code",
+    "client_id": config.GOOGLE_CLIENT_ID,
+    "redirect_uri": config.GOOGLE_REDIRECT_URI,
+    "scope": " ".join(config.GOOGLE_SCOPES),
+    "access_type": "offline",
+    "prompt": "consent",
+}) + "&state="
+
+_LINKEDIN_AUTH_PREFIX = f"{config.LINKEDIN_AUTH_URL}?" + urlencode({
+    "response_type": "code",
+    "client_id": config.LINKEDIN_CLIENT_ID,
+    "redirect_uri": config.LINKEDIN_REDIRECT_URI,
+    "scope": " ".join(config.LINKEDIN_SCOPES),
+}, quote_via=quote) + "&state="
+
+_FACEBOOK_AUTH_PREFIX = "https://www.facebook.com/v12.0/dialog/oauth?" + urlencode({
+    "client_id": config.FACEBOOK_APP_ID,
+    "redirect_uri": config.FACEBOOK_REDIRECT_URI,
+    "scope": "email,public_profile",
+}) + "&state="
+
+# Profile fields a user can update, also used as the Mongo projection
+_PROFILE_FIELDS = {"first_name", "last_name", "email", "mobile_number"}
+_PROFILE_PROJECTION = dict.fromkeys(_PROFILE_FIELDS, 1)
+
+async def _ensure_oauth_password(user: dict):
+    """Give a newly upserted OAuth user an unguessable password they never use"""
+    if user.get("password"):
+        return
+    loop = asyncio.get_running_loop()
+    hashed_password = await loop.run_in_executor(
+        None, hash_password, secrets.token_urlsafe(24)
+    )
+    await users_collection.update_one(
+        {"_id": user["_id"], "password": {"$exists": False}},
+        {"$set": {"password": hashed_password}}
+    )
+
 # Basic authentication routes
-@router.post("/register", response_model=Dict[str, Union[str, Dict[str, str]]])
+@router.post("/register", response_model=AuthResponse)
 async def register_user(user: UserCreate):
-    existing_user = await users_collection.find_one({"email": user.email})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-
-    hashed_password = hash_password(user.password)
+    loop = asyncio.get_running_loop()
+    hashed_password = await loop.run_in_executor(None, hash_password, user.password)
     user_data = {
         "email": user.email,
         "password": hashed_password,
@@ -28,12 +69,15 @@ async def register_user(user: UserCreate):
         "last_name": user.last_name
     }
 
-    result = await users_collection.insert_one(user_data)
+    try:
+        result = await users_collection.insert_one(user_data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     user_id = str(result.inserted_id)
 
     # Generate access token
     access_token = generate_access_token({
-        "sub": user_id,
+        "sub": result.inserted_id,
         "email": user.email
     })
 
@@ -47,30 +91,16 @@ async def register_user(user: UserCreate):
         }
     }
     
-@router.put("/profiles", response_model=Dict[str, Union[str, Dict[str, str]]])
+@router.put("/profiles", response_model=ProfileUpdateResponse)
 async def update_profile(
     update_data: UserCreate,
     current_user: dict = Depends(get_current_user)
 ):
     try:
-        # Extract user ID from the current user
-        user_id = current_user['id']
-        
-        # Prepare update fields dynamically
-        update_fields = {}
-        
-        # Only add fields that are not None to the update
-        if update_data.first_name is not None:
-            update_fields["first_name"] = update_data.first_name
-        
-        if update_data.last_name is not None:
-            update_fields["last_name"] = update_data.last_name
-        
-        if update_data.email is not None:
-            update_fields["email"] = update_data.email
-        
-        if update_data.mobile_number is not None:
-            update_fields["mobile_number"] = update_data.mobile_number
+        # Only update profile fields that were provided and are not None
+        update_fields = update_data.model_dump(
+            include=_PROFILE_FIELDS, exclude_unset=True, exclude_none=True
+        )
         
         # Check if any fields are being updated
         if not update_fields:
@@ -79,23 +109,20 @@ async def update_profile(
                 detail="No update fields provided"
             )
         
-        # Update user in database
-        result = await users_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": update_fields}
+        # Update user and fetch the profile fields in a single round-trip
+        updated_user = await users_collection.find_one_and_update(
+            {"_id": current_user["oid"]},
+            {"$set": update_fields},
+            projection=_PROFILE_PROJECTION,
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.modified_count == 0:
+        if updated_user is None:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, 
-                detail="No changes made to profile"
+                status_code=status.HTTP_404_NOT_FOUND, 
+                detail="User not found"
             )
         
-        # Fetch updated user
-        updated_user = await users_collection.find_one(
-            {"_id": ObjectId(user_id)}
-        )
-        
         return {
             "message": "User profile details Updated Successfully",
             "user": {
@@ -106,25 +133,46 @@ async def update_profile(
                 "mobile_number": updated_user.get("mobile_number")
             }
         }
+    except HTTPException:
+        raise
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, 
+            detail="Email already registered"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
             detail=f"An error occurred during profile update: {str(e)}"
         )
 
-@router.post("/login", response_model=Dict[str, Union[str, Dict[str, str]]])
+@router.post("/login", response_model=AuthResponse)
 async def login_user(login_data: LoginRequest):
-    existing_user = await users_collection.find_one({"email": login_data.email})
-    if not existing_user:
+    existing_user = await users_collection.find_one(
+        {"email": login_data.email},
+        projection={"password": 1, "email": 1, "first_name": 1, "last_name": 1}
+    )
+    if not existing_user or not existing_user.get("password"):
         raise HTTPException(status_code=400, detail="Invalid email or password")
 
-    hashed_password = hash_password(login_data.password)
-    if hashed_password != existing_user["password"]:
+    loop = asyncio.get_running_loop()
+    password_valid = await loop.run_in_executor(
+        None, verify_password, existing_user["password"], login_data.password
+    )
+    if not password_valid:
         raise HTTPException(status_code=400, detail="Invalid email or password")
 
+    # Migrate legacy SHA-256 (or outdated argon2) hashes now that the plain password is known
+    if password_needs_rehash(existing_user["password"]):
+        new_hashed_password = await loop.run_in_executor(None, hash_password, login_data.password)
+        await users_collection.update_one(
+            {"_id": existing_user["_id"]},
+            {"$set": {"password": new_hashed_password}}
+        )
+
     # Generate access token
     access_token = generate_access_token({
-        "sub": str(existing_user["_id"]),
+        "sub": existing_user["_id"],
         "email": existing_user["email"]
     })
 
@@ -139,14 +187,14 @@ async def login_user(login_data: LoginRequest):
     }
 
 @router.post("/forgot-password")
-async def forgot_password(email: str):
-    existing_user = await users_collection.find_one({"email": email})
+async def forgot_password(email: str, background_tasks: BackgroundTasks):
+    existing_user = await users_collection.find_one({"email": email}, projection={"_id": 1})
     if not existing_user:
         raise HTTPException(status_code=400, detail="Email not found")
  
     # Generate temporary password (OTP)
     temp_password = generate_temp_password()
-    hashed_temp_password = hash_password(temp_password)
+    hashed_temp_password = hash_otp(temp_password)
     
     # Store hashed temporary password
     await users_collection.update_one(
@@ -154,8 +202,8 @@ async def forgot_password(email: str):
         {"$set": {"temp_password": hashed_temp_password}}
     )
  
-    # Send temporary password via email
-    send_email(email, temp_password)
+    # Send temporary password via email after the response is returned
+    background_tasks.add_task(send_email, email, temp_password)
     
     return {"message": "Temporary password sent to your email"}
 
@@ -165,15 +213,19 @@ async def reset_password(reset_data: ResetPasswordRequest):
     if reset_data.new_password != reset_data.confirm_password:
         raise HTTPException(status_code=400, detail="Passwords do not match")
     
-    # Find user with the OTP
-    hashed_otp = hash_password(reset_data.otp)
-    existing_user = await users_collection.find_one({"temp_password": hashed_otp})
+    # Find the user and compare the OTP hash in constant time
+    existing_user = await users_collection.find_one(
+        {"email": reset_data.email}, projection={"temp_password": 1}
+    )
+    stored_otp = existing_user.get("temp_password") if existing_user else None
+    hashed_otp = hash_otp(reset_data.otp)
     
-    if not existing_user:
+    if not stored_otp or not hmac.compare_digest(hashed_otp, stored_otp):
         raise HTTPException(status_code=400, detail="Invalid OTP")
  
     # Hash and update the new password
-    hashed_new_password = hash_password(reset_data.new_password)
+    loop = asyncio.get_running_loop()
+    hashed_new_password = await loop.run_in_executor(None, hash_password, reset_data.new_password)
     await users_collection.update_one(
         {"_id": existing_user["_id"]}, 
         {
@@ -187,27 +239,15 @@ async def reset_password(reset_data: ResetPasswordRequest):
 # Google OAuth routes
 @router.get("/google")
 async def auth_google(request: Request):
-    # Generate state and store in session
-    state = generate_oauth_state()
-    request.session["google_oauth_state"] = state
+    # Generate state and store in Redis
+    state = await issue_oauth_state("google")
     
-    params = {
-        "response_type": "code",
-        "client_id": config.GOOGLE_CLIENT_ID,
-        "redirect_uri": config.GOOGLE_REDIRECT_URI,
-        "scope": " ".join(config.GOOGLE_SCOPES),
-        "state": state,
-        "access_type": "offline",
-        "prompt": "consent",
-    }
-    google_auth_url = f"https://accounts.google.com/o/oauth2/auth?{urlencode(params)}"
-    return RedirectResponse(url=google_auth_url)
+    return RedirectResponse(url=_GOOGLE_AUTH_PREFIX + quote(state))
 
 @router.get("/google/callback")
 async def auth_google_callback(request: Request, code: str, state: Optional[str] = None):
     # Verify state to prevent CSRF
-    stored_state = request.session.get("google_oauth_state")
-    if not stored_state or stored_state != state:
+    if not await consume_oauth_state(state, "google"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid state parameter"
@@ -222,8 +262,9 @@ async def auth_google_callback(request: Request, code: str, state: Optional[str]
             "redirect_uri": config.GOOGLE_REDIRECT_URI,
             "grant_type": "authorization_code",
         }
-        response = requests.post(token_url, data=data)
-        token_data = response.json()
+        client = get_http_client()
+        response = await client.post(token_url, data=data)
+        token_data = orjson.loads(response.content)
         access_token = token_data.get("access_token")
 
         if not access_token:
@@ -231,10 +272,15 @@ async def auth_google_callback(request: Request, code: str, state: Optional[str]
                 status_code=400, detail="Failed to retrieve access token"
             )
 
-        user_info_url = "https://www.googleapis.com/oauth2/v1/userinfo"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        user_info_response = requests.get(user_info_url, headers=headers)
-        user_info = user_info_response.json()
+        id_token = token_data.get("id_token")
+        if id_token:
+            # Read the profile from the ID token and skip the userinfo round-trip
+            loop = asyncio.get_running_loop()
+            user_info = await loop.run_in_executor(None, verify_google_id_token, id_token)
+        else:
+            headers = {"Authorization": f"Bearer {access_token}"}
+            user_info_response = await client.get(config.GOOGLE_USER_INFO_URL, headers=headers)
+            user_info = orjson.loads(user_info_response.content)
 
         email = user_info.get("email")
         first_name = user_info.get("given_name", "")
@@ -245,37 +291,32 @@ async def auth_google_callback(request: Request, code: str, state: Optional[str]
                 status_code=400, detail="Failed to retrieve user email"
             )
 
-        existing_user = await users_collection.find_one({"email": email})
-
-        if not existing_user:
-            # Generate a random password for OAuth users
-            hashed_password = hash_password(str(random.randint(100000, 999999)))
-
-            user_data = {
-                "email": email,
-                "first_name": first_name,
-                "last_name": last_name,
-                "password": hashed_password,
-                "auth_provider": "google"
-            }
+        # Accounts are matched by email, so only accept addresses Google has verified
+        if user_info.get("email_verified") not in (True, "true"):
+            raise HTTPException(
+                status_code=400, detail="Google email address is not verified"
+            )
 
-            result = await users_collection.insert_one(user_data)
-            user_id = str(result.inserted_id)
-        else:
-            # Update existing user with latest info
-            await users_collection.update_one(
-                {"email": email},
-                {"$set": {
+        # Create or update the user in a single round-trip
+        user = await users_collection.find_one_and_update(
+            {"email": email},
+            {
+                "$set": {
                     "first_name": first_name,
                     "last_name": last_name,
                     "auth_provider": "google"
-                }}
-            )
-            user_id = str(existing_user["_id"])
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"_id": 1, "password": 1}
+        )
+        await _ensure_oauth_password(user)
+        user_id = str(user["_id"])
 
         # Generate access token
         access_token = generate_access_token({
-            "sub": user_id,
+            "sub": user["_id"],
             "email": email
         })
 
@@ -307,16 +348,9 @@ async def auth_google_callback(request: Request, code: str, state: Optional[str]
 @router.get("/linkedin")
 async def auth_linkedin(request: Request):
     # Generate random state for CSRF protection
-    state = generate_oauth_state()
-    request.session["linkedin_oauth_state"] = state
-    
-    # URL encode the redirect URI
-    redirect_uri = quote(config.LINKEDIN_REDIRECT_URI)
+    state = await issue_oauth_state("linkedin")
     
-    # Use OpenID Connect scopes
-    auth_url = f"{config.LINKEDIN_AUTH_URL}?response_type=code&client_id={config.LINKEDIN_CLIENT_ID}&redirect_uri={redirect_uri}&state={state}&scope=openid%20profile%20email"
-    
-    return RedirectResponse(auth_url)
+    return RedirectResponse(_LINKEDIN_AUTH_PREFIX + quote(state))
 
 @router.get("/linkedin/callback")
 async def linkedin_callback(request: Request, code: Optional[str] = None, state: Optional[str] = None, error: Optional[str] = None, error_description: Optional[str] = None):
@@ -339,8 +373,7 @@ async def linkedin_callback(request: Request, code: Optional[str] = None, state:
         )
     
     # Verify state to prevent CSRF attacks
-    stored_state = request.session.get("linkedin_oauth_state")
-    if not stored_state or stored_state != state:
+    if not await consume_oauth_state(state, "linkedin"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid state parameter"
@@ -360,97 +393,82 @@ async def linkedin_callback(request: Request, code: Optional[str] = None, state:
     }
     
     try:
-        async with httpx.AsyncClient() as client:
-            # Get access token
-            token_response = await client.post(
-                config.LINKEDIN_TOKEN_URL,
-                data=token_data,
-                headers=headers
-            )
-            
-            token_response.raise_for_status()
-            token_info = token_response.json()
-            oauth_access_token = token_info["access_token"]
-            
-            # Get user info from OpenID Connect userinfo endpoint
-            user_response = await client.get(
-                config.LINKEDIN_USER_INFO_URL,
-                headers={"Authorization": f"Bearer {oauth_access_token}"}
+        client = get_http_client()
+        # Get access token
+        token_response = await client.post(
+            config.LINKEDIN_TOKEN_URL,
+            data=token_data,
+            headers=headers
+        )
+        
+        token_response.raise_for_status()
+        token_info = orjson.loads(token_response.content)
+        oauth_access_token = token_info["access_token"]
+        
+        # Get user info from OpenID Connect userinfo endpoint
+        user_response = await client.get(
+            config.LINKEDIN_USER_INFO_URL,
+            headers={"Authorization": f"Bearer {oauth_access_token}"}
+        )
+        
+        user_response.raise_for_status()
+        user_data = orjson.loads(user_response.content)
+        
+        # Extract user information from OpenID Connect format
+        user_id = user_data.get("sub", "")
+        email = user_data.get("email", "")
+        given_name = user_data.get("given_name", "")
+        family_name = user_data.get("family_name", "")
+        
+        if not email:
+            raise HTTPException(
+                status_code=400, detail="Failed to retrieve user email"
             )
             
-            user_response.raise_for_status()
-            user_data = user_response.json()
-            
-            # Extract user information from OpenID Connect format
-            user_id = user_data.get("sub", "")
-            email = user_data.get("email", "")
-            given_name = user_data.get("given_name", "")
-            family_name = user_data.get("family_name", "")
-            
-            if not email:
-                raise HTTPException(
-                    status_code=400, detail="Failed to retrieve user email"
-                )
-                
-            # Check if user exists
-            existing_user = await users_collection.find_one({"email": email})
-            
-            if not existing_user:
-                # Generate a random password for OAuth users
-                hashed_password = hash_password(str(random.randint(100000, 999999)))
-                
-                # Prepare user data for DB
-                linkedin_user_data = {
-                    "email": email,
+        # Create or update the user with LinkedIn info in a single round-trip
+        user = await users_collection.find_one_and_update(
+            {"email": email},
+            {
+                "$set": {
                     "first_name": given_name,
                     "last_name": family_name,
-                    "password": hashed_password,
                     "linkedin_id": user_id,
                     "auth_provider": "linkedin"
                 }
-                
-                # Save to MongoDB
-                result = await users_collection.insert_one(linkedin_user_data)
-                user_id = str(result.inserted_id)
-            else:
-                # Update user data with LinkedIn info
-                await users_collection.update_one(
-                    {"email": email},
-                    {"$set": {
-                        "first_name": given_name,
-                        "last_name": family_name,
-                        "linkedin_id": user_id,
-                        "auth_provider": "linkedin"
-                    }}
-                )
-                user_id = str(existing_user["_id"])
-            
-            # Generate application access token
-            access_token = generate_access_token({
-                "sub": user_id,
-                "email": email
-            })
-            
-            # Store user in session
-            request.session["user"] = {
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"_id": 1, "password": 1}
+        )
+        await _ensure_oauth_password(user)
+        user_id = str(user["_id"])
+        
+        # Generate application access token
+        access_token = generate_access_token({
+            "sub": user["_id"],
+            "email": email
+        })
+        
+        # Store user in session
+        request.session["user"] = {
+            "id": user_id,
+            "email": email, 
+            "first_name": given_name,
+            "last_name": family_name,
+            "auth_provider": "linkedin"
+        }
+        
+        # Return user data and token
+        return {
+            "access_token": access_token,
+            "user": {
                 "id": user_id,
-                "email": email, 
                 "first_name": given_name,
                 "last_name": family_name,
-                "auth_provider": "linkedin"
-            }
-            
-            # Return user data and token
-            return {
-                "access_token": access_token,
-                "user": {
-                    "id": user_id,
-                    "first_name": given_name,
-                    "last_name": family_name,
-                    "email": email
-                }
+                "email": email
             }
-    
+        }
+
     except httpx.HTTPStatusError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -466,19 +484,9 @@ async def linkedin_callback(request: Request, code: Optional[str] = None, state:
 @router.get("/facebook")
 async def auth_facebook(request: Request):
     # Generate random state for CSRF protection
-    state = generate_oauth_state()
-    request.session["facebook_oauth_state"] = state
-    
-    # Construct Facebook OAuth URL
-    params = {
-        "client_id": config.FACEBOOK_APP_ID,
-        "redirect_uri": config.FACEBOOK_REDIRECT_URI,
-        "state": state,
-        "scope": "email,public_profile"
-    }
-    facebook_auth_url = f"https://www.facebook.com/v12.0/dialog/oauth?{urlencode(params)}"
+    state = await issue_oauth_state("facebook")
     
-    return RedirectResponse(url=facebook_auth_url)
+    return RedirectResponse(url=_FACEBOOK_AUTH_PREFIX + quote(state))
 
 @router.get("/facebook/callback")
 async def facebook_callback(request: Request, code: Optional[str] = None, state: Optional[str] = None, error: Optional[str] = None, error_description: Optional[str] = None):
@@ -501,8 +509,7 @@ async def facebook_callback(request: Request, code: Optional[str] = None, state:
         )
     
     # Verify state to prevent CSRF attacks
-    stored_state = request.session.get("facebook_oauth_state")
-    if not stored_state or stored_state != state:
+    if not await consume_oauth_state(state, "facebook"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid state parameter"
@@ -518,93 +525,77 @@ async def facebook_callback(request: Request, code: Optional[str] = None, state:
             "code": code
         }
         
-        async with httpx.AsyncClient() as client:
-            # Get access token
-            token_response = await client.get(token_url, params=token_params)
-            token_response.raise_for_status()
-            token_data = token_response.json()
-            access_token = token_data["access_token"]
-            
-            # Get user profile information
-            user_info_url = "https://graph.facebook.com/me"
-            user_params = {
-                "fields": "id,email,first_name,last_name,picture",
-                "access_token": access_token
-            }
-            
-            user_response = await client.get(user_info_url, params=user_params)
-            user_response.raise_for_status()
-            user_data = user_response.json()
-            
-            # Extract user information
-            facebook_id = user_data.get("id", "")
-            email = user_data.get("email", "")
-            first_name = user_data.get("first_name", "")
-            last_name = user_data.get("last_name", "")
-            profile_picture = user_data.get("picture", {}).get("data", {}).get("url", "")
-            
-            if not email:
-                raise HTTPException(
-                    status_code=400, detail="Failed to retrieve user email"
-                )
-            
-            # Check if user exists
-            existing_user = await users_collection.find_one({"email": email})
-            
-            if not existing_user:
-                # Generate a random password for OAuth users
-                hashed_password = hash_password(str(random.randint(100000, 999999)))
-                
-                # Prepare user data for DB
-                facebook_user_data = {
-                    "email": email,
+        client = get_http_client()
+        # Get access token
+        token_response = await client.get(token_url, params=token_params)
+        token_response.raise_for_status()
+        token_data = orjson.loads(token_response.content)
+        access_token = token_data["access_token"]
+        
+        # Get user profile information
+        user_info_url = "https://graph.facebook.com/me"
+        user_params = {
+            "fields": "id,email,first_name,last_name,picture",
+            "access_token": access_token
+        }
+        
+        user_response = await client.get(user_info_url, params=user_params)
+        user_response.raise_for_status()
+        user_data = orjson.loads(user_response.content)
+        
+        # Extract user information
+        facebook_id = user_data.get("id", "")
+        email = user_data.get("email", "")
+        first_name = user_data.get("first_name", "")
+        last_name = user_data.get("last_name", "")
+        profile_picture = user_data.get("picture", {}).get("data", {}).get("url", "")
+        
+        if not email:
+            raise HTTPException(
+                status_code=400, detail="Failed to retrieve user email"
+            )
+        
+        # Create or update the user with Facebook info in a single round-trip
+        user = await users_collection.find_one_and_update(
+            {"email": email},
+            {
+                "$set": {
                     "first_name": first_name,
                     "last_name": last_name,
-                    "password": hashed_password,
                     "facebook_id": facebook_id,
                     "profile_picture": profile_picture,
                     "auth_provider": "facebook"
                 }
-                
-                # Save to MongoDB
-                result = await users_collection.insert_one(facebook_user_data)
-                user_id = str(result.inserted_id)
-            else:
-                # Update user data with Facebook info
-                await users_collection.update_one(
-                    {"email": email},
-                    {"$set": {
-                        "first_name": first_name,
-                        "last_name": last_name,
-                        "facebook_id": facebook_id,
-                        "profile_picture": profile_picture,
-                        "auth_provider": "facebook"
-                    }}
-                )
-                user_id = str(existing_user["_id"])
-            
-            # Store user in session
-            request.session["user"] = {
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"_id": 1, "password": 1}
+        )
+        await _ensure_oauth_password(user)
+        user_id = str(user["_id"])
+        
+        # Store user in session
+        request.session["user"] = {
+            "id": user_id,
+            "email": email, 
+            "first_name": first_name,
+            "last_name": last_name,
+            "profile_picture": profile_picture,
+            "auth_provider": "facebook"
+        }
+        
+        # Return user data (updated response)
+        return {
+            "access_token": access_token,
+            "user": {
                 "id": user_id,
-                "email": email, 
                 "first_name": first_name,
                 "last_name": last_name,
-                "profile_picture": profile_picture,
-                "auth_provider": "facebook"
-            }
-            
-            # Return user data (updated response)
-            return {
-                "access_token": access_token,
-                "user": {
-                    "id": user_id,
-                    "first_name": first_name,
-                    "last_name": last_name,
-                    "email": email,
-                    "profile_picture": profile_picture
-                }
+                "email": email,
+                "profile_picture": profile_picture
             }
-    
+        }
+
     except httpx.HTTPStatusError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
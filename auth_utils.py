@@ -1,41 +1,99 @@
+import base64
 import hashlib
-import random
+import hmac
 import smtplib
-import os
 import secrets
+import time
 from email.mime.text import MIMEText
-from config import SMTP_SERVER, SMTP_PORT
+from config import settings, SMTP_SERVER, SMTP_PORT, GOOGLE_CLIENT_ID, GOOGLE_JWKS_URL, GOOGLE_ISSUERS
+from database import redis_client
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, Optional
-from fastapi import HTTPException, status, Header
-from dotenv import load_dotenv
+from fastapi import Depends, HTTPException, status, Header
+from bson import ObjectId
+from bson.errors import InvalidId
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from cachetools import TLRUCache
 
 # Updated import for PyJWT
 import jwt
 
-load_dotenv()
-
 # Get the secret key from environment variable
-SECRET_KEY = os.getenv('JWT_SECRET_KEY')
+SECRET_KEY = settings.jwt_secret_key
+
+# Signing key and decode options are fixed, so prepare them once
+_JWT_KEY = SECRET_KEY.encode()
+_JWT_ALGORITHMS = ("HS256",)
+_JWT_OPTIONS = {"require": ["exp", "sub"], "verify_signature": True}
+
+# Get the OTP hashing key from environment variable
+OTP_KEY = settings.otp_key
+_OTP_KEY = OTP_KEY.encode()
+
+# Only 9,000 OTPs exist, so the key carries all the strength; BLAKE2b accepts keys of up to 64 bytes
+if not 32 <= len(_OTP_KEY) <= 64:
+    raise ValueError("OTP_KEY must be 32 to 64 bytes")
 
-# Ensure the secret key is not None
-if not SECRET_KEY:
-    raise ValueError("JWT_SECRET_KEY must be set in the environment variables")
+# Resolved users per token as (user, exp), kept for at most 60 seconds and never past the token's expiry
+USER_CACHE_TTL = 60
+_user_cache = TLRUCache(
+    maxsize=10000,
+    ttu=lambda _key, entry, now: min(now + USER_CACHE_TTL, entry[1]),
+    timer=time.time,
+)
+
+# Argon2id hasher; the encoded hash carries its own salt and parameters
+ph = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+
+# Passwords stored before argon2 are salted SHA-256 hex digests; they are rehashed on login
+PASSWORD_SALT = settings.password_salt
 
 # Function to hash passwords
 def hash_password(password: str) -> str:
     """
-    Hash password using SHA-256 with a salt
+    Hash password using Argon2id
+    """
+    return ph.hash(password)
+
+# Function to verify passwords
+def verify_password(hashed_password: str, password: str) -> bool:
+    """
+    Verify a password against its Argon2id hash, or a legacy SHA-256 hash
+
+    :param hashed_password: Encoded hash from the database
+    :param password: Plain text password to check
+    :return: Boolean indicating whether the password matches
     """
-    salt = os.getenv("PASSWORD_SALT", "default_salt")
-    return hashlib.sha256((password + salt).encode()).hexdigest()
+    if not hashed_password.startswith("$argon2"):
+        legacy_hash = hashlib.sha256((password + PASSWORD_SALT).encode()).hexdigest()
+        return hmac.compare_digest(legacy_hash, hashed_password)
+
+    try:
+        return ph.verify(hashed_password, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+# Function to check whether a stored password should be rehashed
+def password_needs_rehash(hashed_password: str) -> bool:
+    """
+    Check whether a verified password hash is legacy SHA-256 or uses outdated Argon2 parameters
+    """
+    return not hashed_password.startswith("$argon2") or ph.check_needs_rehash(hashed_password)
+
+# Function to hash OTPs
+def hash_otp(otp: str) -> str:
+    """
+    Hash OTP with keyed BLAKE2b so it can be looked up in the database
+    """
+    return hashlib.blake2b(otp.encode(), key=_OTP_KEY, digest_size=16).hexdigest()
 
 # Function to generate a 4-digit temporary password/OTP
 def generate_temp_password() -> str:
     """
     Generate a 4-digit temporary password/OTP
     """
-    return str(random.randint(1000, 9999))
+    return f"{1000 + secrets.randbelow(9000):04d}"
 
 # Function to generate random state for OAuth
 def generate_oauth_state() -> str:
@@ -44,13 +102,44 @@ def generate_oauth_state() -> str:
     """
     return secrets.token_urlsafe(16)
 
+# OAuth state is valid for 10 minutes
+OAUTH_STATE_TTL = 600
+
+# Function to issue OAuth state
+async def issue_oauth_state(provider: str) -> str:
+    """
+    Generate OAuth state and store it in Redis so any worker can verify the callback
+
+    :param provider: Provider the state is issued for
+    :return: State parameter to send to the provider
+    """
+    while True:
+        state = generate_oauth_state()
+        # NX never overwrites an outstanding state, so each value is issued once
+        if await redis_client.set(f"oauth_state:{state}", provider, ex=OAUTH_STATE_TTL, nx=True):
+            return state
+
+# Function to consume OAuth state
+async def consume_oauth_state(state: Optional[str], provider: str) -> bool:
+    """
+    Atomically fetch and delete OAuth state so it can only be used once
+
+    :param state: State parameter returned by the OAuth provider
+    :param provider: Provider the state was issued for
+    :return: Boolean indicating whether the state is valid
+    """
+    if not state:
+        return False
+    stored_provider = await redis_client.getdel(f"oauth_state:{state}")
+    return stored_provider == provider
+
 # Function to send email
 def send_email(to_email: str, temp_password: str):
     """
     Send email with temporary password
     """
-    sender_email = os.getenv("SMTP_EMAIL")
-    sender_password = os.getenv("SMTP_PASSWORD")
+    sender_email = settings.smtp_email
+    sender_password = settings.smtp_password
     
     if not sender_email or not sender_password:
         # Use fallback if environment variables not set
@@ -80,10 +169,10 @@ def generate_otp(email: str, users_collection) -> str:
     otp = generate_temp_password()
     
     # Hash the OTP
-    hashed_otp = hash_password(otp)
+    hashed_otp = hash_otp(otp)
     
     # Set OTP expiration (15 minutes from now)
-    expiration = datetime.utcnow() + timedelta(minutes=15)
+    expiration = datetime.now(timezone.utc) + timedelta(minutes=15)
     
     # Update user document with hashed OTP and expiration
     users_collection.update_one(
@@ -117,14 +206,14 @@ def verify_otp(email: str, otp: str, users_collection) -> bool:
     # Check if OTP exists and is not expired
     if (not user.get("temp_password") or 
         not user.get("otp_expiration") or 
-        datetime.utcnow() > user.get("otp_expiration")):
+        datetime.now(timezone.utc) > user.get("otp_expiration")):
         return False
     
     # Hash the provided OTP
-    hashed_otp = hash_password(otp)
+    hashed_otp = hash_otp(otp)
     
-    # Compare hashed OTPs
-    return hashed_otp == user.get("temp_password")
+    # Compare hashed OTPs in constant time
+    return hmac.compare_digest(hashed_otp, user.get("temp_password"))
 
 # Updated function to generate access tokens
 def generate_access_token(user_data: Dict[str, Any], expires_delta: timedelta = None) -> str:
@@ -138,6 +227,10 @@ def generate_access_token(user_data: Dict[str, Any], expires_delta: timedelta =
     # Create a copy of user data to avoid modifying the original
     to_encode = user_data.copy()
     
+    # Store ObjectId subjects as their raw 12 bytes in base64url
+    if isinstance(to_encode.get("sub"), ObjectId):
+        to_encode["sub"] = base64.urlsafe_b64encode(to_encode["sub"].binary).rstrip(b"=").decode()
+    
     # Set default expiration to 1 day if not specified
     if expires_delta is None:
         expires_delta = timedelta(days=1)
@@ -155,7 +248,7 @@ def generate_access_token(user_data: Dict[str, Any], expires_delta: timedelta =
     })
     
     # Use the secret key from environment variable
-    return jwt.encode(payload=to_encode, key=SECRET_KEY, algorithm="HS256")
+    return jwt.encode(payload=to_encode, key=_JWT_KEY, algorithm="HS256")
 
 def verify_access_token(token: str) -> Dict[str, Any]:
     """
@@ -166,15 +259,54 @@ def verify_access_token(token: str) -> Dict[str, Any]:
     """
     try:
         # Use the secret key from environment variable
-        return jwt.decode(token, key=SECRET_KEY, algorithms=["HS256"])
+        return jwt.decode(token, key=_JWT_KEY, algorithms=_JWT_ALGORITHMS, options=_JWT_OPTIONS)
     except jwt.ExpiredSignatureError:
         raise ValueError("Token has expired")
     except jwt.InvalidTokenError:
         raise ValueError("Invalid token")
-    
-    
-    
-def get_current_user(authorization: Optional[str] = Header(None)):
+
+# Google's signing keys, fetched on first use and cached for an hour
+_google_jwk_client = jwt.PyJWKClient(GOOGLE_JWKS_URL, cache_keys=True, lifespan=3600)
+
+# Tolerated clock skew against Google, so freshly issued tokens are not rejected as immature
+GOOGLE_ID_TOKEN_LEEWAY = timedelta(seconds=60)
+
+def verify_google_id_token(id_token: str) -> Dict[str, Any]:
+    """
+    Verify a Google ID token against Google's published signing keys
+
+    Blocks on a network fetch when the key set is not cached yet, so call it
+    from an executor.
+
+    :param id_token: ID token from Google's token endpoint
+    :return: Decoded ID token claims
+    """
+    signing_key = _google_jwk_client.get_signing_key_from_jwt(id_token)
+    return jwt.decode(
+        id_token,
+        key=signing_key.key,
+        algorithms=["RS256"],
+        audience=GOOGLE_CLIENT_ID,
+        issuer=GOOGLE_ISSUERS,
+        leeway=GOOGLE_ID_TOKEN_LEEWAY,
+    )
+
+def decode_user_id(sub: str) -> ObjectId:
+    """
+    Convert a token subject back into the user's ObjectId
+
+    :param sub: Subject claim from the access token
+    :return: User ObjectId
+    """
+    try:
+        # Tokens issued before subjects were base64url-encoded carry the hex ObjectId
+        if len(sub) == 24:
+            return ObjectId(sub)
+        return ObjectId(base64.urlsafe_b64decode(sub + "=="))
+    except (InvalidId, TypeError, ValueError):
+        raise ValueError("Invalid token")
+
+async def get_current_user(authorization: Optional[str] = Header(None)):
     """
     Extract and verify user from access token
 
@@ -187,10 +319,28 @@ def get_current_user(authorization: Optional[str] = Header(None)):
             detail="Missing or invalid access token",
         )
 
-    # Extract and verify token
+    # Extract token and reuse the user resolved for it on a recent request
     token = authorization.split(" ")[1]
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    entry = _user_cache.get(cache_key)
+    if entry is not None:
+        return entry[0]
+
     try:
         token_data = verify_access_token(token)
-        return {"id": token_data.get("sub"), "email": token_data.get("email")}
+        user_oid = decode_user_id(token_data["sub"])
     except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+
+    user = {"id": str(user_oid), "oid": user_oid, "email": token_data.get("email")}
+    _user_cache[cache_key] = (user, token_data["exp"])
+    return user
+
+async def get_current_user_id(current_user: dict = Depends(get_current_user)) -> str:
+    """
+    Resolve only the authenticated user's id, for handlers that need nothing else
+
+    :param current_user: User resolved by get_current_user
+    :return: User id as a string
+    """
+    return current_user["id"]
\ No newline at end of file
@@ -1,17 +1,64 @@
-import os
-from dotenv import load_dotenv
+from pathlib import Path
+from typing import List, Optional
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
-# Load environment variables from .env file
-load_dotenv()
+
+# All environment settings, read from the environment and .env once at import
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=Path(__file__).with_name(".env"), extra="ignore", frozen=True
+    )
+
+    # Sessions
+    session_secret_key: str
+
+    # Browser origins allowed to call the API, given as a JSON list in CORS_ORIGINS
+    cors_origins: List[str]
+
+    # Database
+    mongodb_url: str
+    db_name: str
+    redis_url: str = "redis://localhost:6379/0"
+    atlas_search_enabled: bool = False
+
+    # Token and OTP signing
+    jwt_secret_key: str = Field(min_length=1)
+    otp_key: str
+
+    # Salt of the legacy SHA-256 password hashes, needed until every user is rehashed with argon2
+    password_salt: str = "default_salt"
+
+    # OAuth
+    google_client_id: Optional[str] = None
+    google_client_secret: Optional[str] = None
+    google_redirect_uri: Optional[str] = None
+
+    linkedin_client_id: Optional[str] = None
+    linkedin_client_secret: Optional[str] = None
+    linkedin_redirect_uri: Optional[str] = None
+
+    facebook_app_id: Optional[str] = None
+    facebook_app_secret: Optional[str] = None
+    facebook_redirect_uri: Optional[str] = None
+
+    # SMTP
+    smtp_server: Optional[str] = None
+    smtp_port: int
+    smtp_email: Optional[str] = None
+    smtp_password: Optional[str] = None
+
+
+settings = Settings()
 
 # OAuth Configuration
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
+GOOGLE_CLIENT_ID = settings.google_client_id
+GOOGLE_CLIENT_SECRET = settings.google_client_secret
+GOOGLE_REDIRECT_URI = settings.google_redirect_uri
 
-LINKEDIN_CLIENT_ID = os.getenv("LINKEDIN_CLIENT_ID")
-LINKEDIN_CLIENT_SECRET = os.getenv("LINKEDIN_CLIENT_SECRET")
-LINKEDIN_REDIRECT_URI = os.getenv("LINKEDIN_REDIRECT_URI")
+LINKEDIN_CLIENT_ID = settings.linkedin_client_id
+LINKEDIN_CLIENT_SECRET = settings.linkedin_client_secret
+LINKEDIN_REDIRECT_URI = settings.linkedin_redirect_uri
 
 # OAuth scopes
 GOOGLE_SCOPES = [
@@ -23,15 +70,19 @@ GOOGLE_SCOPES = [
 LINKEDIN_SCOPES = ["openid", "profile", "email"]
 
 # API URLs
+GOOGLE_USER_INFO_URL = "https://openidconnect.googleapis.com/v1/userinfo"
+GOOGLE_JWKS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+GOOGLE_ISSUERS = ["https://accounts.google.com", "accounts.google.com"]
+
 LINKEDIN_AUTH_URL = "https://www.linkedin.com/oauth/v2/authorization"
 LINKEDIN_TOKEN_URL = "https://www.linkedin.com/oauth/v2/accessToken"
 LINKEDIN_USER_INFO_URL = "https://api.linkedin.com/v2/userinfo"
 
 # Facebook OAuth Configuration
-FACEBOOK_APP_ID = os.getenv("FACEBOOK_APP_ID")
-FACEBOOK_APP_SECRET = os.getenv("FACEBOOK_APP_SECRET")
-FACEBOOK_REDIRECT_URI = os.getenv("FACEBOOK_REDIRECT_URI")
+FACEBOOK_APP_ID = settings.facebook_app_id
+FACEBOOK_APP_SECRET = settings.facebook_app_secret
+FACEBOOK_REDIRECT_URI = settings.facebook_redirect_uri
 
 # SMTP settings
-SMTP_SERVER = os.getenv("SMTP_SERVER")
-SMTP_PORT = int(os.getenv("SMTP_PORT"))
\ No newline at end of file
+SMTP_SERVER = settings.smtp_server
+SMTP_PORT = settings.smtp_port
\ No newline at end of file
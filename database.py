@@ -1,21 +1,86 @@
-import os
+import redis.asyncio as redis
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from dotenv import load_dotenv
-
-load_dotenv()
+from pymongo.errors import OperationFailure
+from config import settings
 
 # Database connection settings
-MONGODB_URL = os.getenv("MONGODB_URL")
-DB_NAME = os.getenv("DB_NAME")
+MONGODB_URL = settings.mongodb_url
+DB_NAME = settings.db_name
+REDIS_URL = settings.redis_url
+
+# Atlas Search is only available on MongoDB Atlas; self-managed deployments use a text index
+ATLAS_SEARCH_ENABLED = settings.atlas_search_enabled
+
+# Document fields covered by search
+DOCUMENT_SEARCH_FIELDS = ["document_name", "name", "book_name", "author_name", "company_name"]
+DOCUMENT_SEARCH_INDEX = "documents_search"
+
+# Lowercased copies of the search fields, so prefix searches can use an index
+DOCUMENT_SEARCH_SHADOW_FIELDS = {field: f"{field}_lc" for field in DOCUMENT_SEARCH_FIELDS}
 
 
 class Database:
     def __init__(self):
-        self.client = AsyncIOMotorClient(MONGODB_URL)
+        self.client = AsyncIOMotorClient(
+            MONGODB_URL,
+            maxPoolSize=200,
+            minPoolSize=20,
+            maxIdleTimeMS=60000,
+            serverSelectionTimeoutMS=3000,
+            retryWrites=True,
+            compressors="zstd,zlib",
+            tz_aware=True,
+        )
         self.db = self.client[DB_NAME]
         self.users_collection = self.db["users"]
         self.documents_collection = self.db["documents"]
 
+    async def create_indexes(self):
+        # Unique email index backs every login lookup and rejects duplicate registrations
+        await self.users_collection.create_index("email", unique=True)
+
+        # Cover the list queries' user_id (and scan_type) filter and the newest-first sort
+        await self.documents_collection.create_index(
+            [("user_id", 1), ("created_at", -1), ("_id", -1)]
+        )
+        await self.documents_collection.create_index(
+            [("user_id", 1), ("scan_type", 1), ("created_at", -1), ("_id", -1)]
+        )
+
+        # Prefix search on each lowercased field, scoped to one user's keys
+        for shadow_field in DOCUMENT_SEARCH_SHADOW_FIELDS.values():
+            await self.documents_collection.create_index([("user_id", 1), (shadow_field, 1)])
+
+        if ATLAS_SEARCH_ENABLED:
+            await self.create_search_index()
+
+    async def has_search_index(self) -> bool:
+        existing = await self.documents_collection.list_search_indexes(
+            DOCUMENT_SEARCH_INDEX
+        ).to_list(length=1)
+        return bool(existing)
+
+    async def create_search_index(self):
+        if await self.has_search_index():
+            return
+
+        fields = {field: {"type": "autocomplete"} for field in DOCUMENT_SEARCH_FIELDS}
+        fields["user_id"] = {"type": "token"}
+        try:
+            await self.documents_collection.create_search_index(
+                {
+                    "name": DOCUMENT_SEARCH_INDEX,
+                    "definition": {"mappings": {"dynamic": False, "fields": fields}},
+                }
+            )
+        except OperationFailure:
+            # Workers start together, so another one may have created the index since the check
+            if not await self.has_search_index():
+                raise
+
+    def close(self):
+        self.client.close()
+
     def get_users_collection(self):
         return self.users_collection
 
@@ -30,6 +95,9 @@ db_instance = Database()
 users_collection = db_instance.get_users_collection()
 documents_collection = db_instance.get_documents_collection()
 
+# Shared Redis connection pool for short-lived auth state
+redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+
 
 def get_db() -> AsyncIOMotorDatabase:
     return db_instance.db  # Return the database instance
@@ -1,75 +1,165 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Header
+import base64
+import json
+import re
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status, Header
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from typing import List
-from models import DocumentCreate, DocumentUpdate, DocumentResponse
-from database import get_db
-from datetime import datetime
-from auth_utils import get_current_user
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from typing import Any, Dict, List, Optional
+from models import Document, DocumentCreate, DocumentUpdate, DocumentResponse, DocumentPage, DocumentBulkDelete, ScanType, DOCUMENT_SERVER_FIELDS
+from database import get_db, ATLAS_SEARCH_ENABLED, DOCUMENT_SEARCH_FIELDS, DOCUMENT_SEARCH_INDEX, DOCUMENT_SEARCH_SHADOW_FIELDS
+from datetime import datetime, timezone
+from auth_utils import get_current_user_id
 
 app = APIRouter(tags=["documents"])
 
+# Fields returned to clients; _id is always included by MongoDB
+DOC_PROJECTION = {field: 1 for field in Document.model_fields if field != "id"}
+
+# List endpoints return newest documents first; _id breaks ties between equal timestamps
+PAGE_SORT = [("created_at", -1), ("_id", -1)]
+
+
+def encode_cursor(document: Dict[str, Any]) -> str:
+    """Encode the sort position of a document as an opaque base64url cursor"""
+    created_at = document.get("created_at")
+    position = {
+        "id": str(document["_id"]),
+        "created_at": created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+    }
+    # Older documents may hold created_at as a string; keep it one so the cursor compares like with like
+    if isinstance(created_at, str):
+        position["created_at_is_str"] = True
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor into a query matching documents after that position"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        last_id = ObjectId(position["id"])
+        created_at = position["created_at"]
+        if created_at is not None and not isinstance(created_at, str):
+            raise TypeError("created_at must be a string")
+        if created_at is not None and not position.get("created_at_is_str"):
+            created_at = datetime.fromisoformat(created_at)
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Ties on created_at continue by _id; null and missing values sort last, so nothing follows them
+    after = [{"created_at": created_at, "_id": {"$lt": last_id}}]
+    if created_at is None:
+        return {"$or": after}
+
+    # Range queries only match values of the same BSON type, so the types sorting below the
+    # cursor's (legacy strings after dates, then null or missing) need a branch of their own
+    paged_types = ["date", "string"] if isinstance(created_at, str) else ["date"]
+    after += [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": {"$not": {"$type": paged_types}}},
+    ]
+    return {"$or": after}
+
+
+def build_page(documents: List[Dict[str, Any]], limit: int) -> DocumentPage:
+    """Build a page from up to limit + 1 documents, using the extra one to detect a next page"""
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1])
+
+    # Validate the whole page in a single pass through pydantic-core
+    return DocumentPage.model_validate({"items": documents, "next_cursor": next_cursor})
+
+
+def get_request_time(request: Request) -> datetime:
+    """Timestamp taken once per request by RequestTimeMiddleware, at BSON's millisecond precision"""
+    now = getattr(request.state, "now", None) or datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def add_search_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Store lowercased copies of the searchable fields being written"""
+    for field, shadow_field in DOCUMENT_SEARCH_SHADOW_FIELDS.items():
+        value = data.get(field)
+        if isinstance(value, str):
+            data[shadow_field] = value.lower()
+    return data
+
+
+def parse_object_id(document_id: str) -> ObjectId:
+    """Parse the document_id path parameter into an ObjectId"""
+    try:
+        return ObjectId(document_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid document ID format")
+
+
+async def fetch_page(
+    db: AsyncIOMotorDatabase, query: Dict[str, Any], cursor: Optional[str], limit: int
+) -> DocumentPage:
+    """Fetch one page of documents with keyset pagination"""
+    if cursor:
+        query = {"$and": [query, decode_cursor(cursor)]}
+
+    # Fetch one extra document to find out whether another page exists
+    documents = (
+        await db.documents.find(query, projection=DOC_PROJECTION)
+        .sort(PAGE_SORT)
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+
+    return build_page(documents, limit)
+
 
 @app.post("/", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
 async def create_document(
     document: DocumentCreate,
     db: AsyncIOMotorDatabase = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    now: datetime = Depends(get_request_time),
 ):
     """Create a new document"""
-    # Ensure user_id matches the authenticated user
-    document_data = document.model_dump(exclude_unset=True)
-    document_data["user_id"] = current_user["id"]
+    # Server-managed fields are never taken from the client; user_id is always the authenticated user
+    document_data = document.model_dump(exclude_unset=True, exclude=DOCUMENT_SERVER_FIELDS)
+    document_data["user_id"] = user_id
 
     # Add timestamp fields
-    current_time = datetime.utcnow()
-    document_data["created_at"] = current_time
-    document_data["updated_at"] = current_time
+    document_data["created_at"] = now
+    document_data["updated_at"] = now
 
     # Insert into database
-    result = await db.documents.insert_one(document_data)
-
-    # Get the newly created document
-    created_document = await db.documents.find_one({"_id": result.inserted_id})
+    result = await db.documents.insert_one(add_search_fields(document_data))
 
-    if created_document is None:
-        raise HTTPException(status_code=404, detail="Document creation failed")
+    # Nothing is changed server-side, so build the response from what was inserted
+    document_data["_id"] = result.inserted_id
+    return DocumentResponse.from_mongo(document_data)
 
-    # Convert MongoDB document to Pydantic model
-    return DocumentResponse.from_mongo(created_document)
 
-
-@app.get("/", response_model=List[DocumentResponse])
+@app.get("/", response_model=DocumentPage)
 async def read_documents(
-    skip: int = 0,
-    limit: int = 10,
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
     db: AsyncIOMotorDatabase = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
 ):
-    """Get all documents for the authenticated user with pagination"""
+    """Get all documents for the authenticated user with cursor pagination"""
     # Find documents for the specific user
-    documents = (
-        await db.documents.find({"user_id": current_user["id"]})
-        .skip(skip)
-        .limit(limit)
-        .to_list(length=limit)
-    )
-
-    return [DocumentResponse.from_mongo(doc) for doc in documents]
+    return await fetch_page(db, {"user_id": user_id}, cursor, limit)
 
 
 @app.get("/{document_id}", response_model=DocumentResponse)
 async def read_document(
-    document_id: str,
     db: AsyncIOMotorDatabase = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    document_oid: ObjectId = Depends(parse_object_id),
 ):
     """Get a single document by ID for the authenticated user"""
-    if not ObjectId.is_valid(document_id):
-        raise HTTPException(status_code=400, detail="Invalid document ID format")
-
     document = await db.documents.find_one(
-        {"_id": ObjectId(document_id), "user_id": current_user["id"]}
+        {"_id": document_oid, "user_id": user_id},
+        projection=DOC_PROJECTION,
     )
 
     if document is None:
@@ -82,54 +172,48 @@ async def read_document(
 
 @app.put("/{document_id}", response_model=DocumentResponse)
 async def update_document(
-    document_id: str,
     document: DocumentUpdate,
     db: AsyncIOMotorDatabase = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    document_oid: ObjectId = Depends(parse_object_id),
+    now: datetime = Depends(get_request_time),
 ):
     """Update a document for the authenticated user"""
-    if not ObjectId.is_valid(document_id):
-        raise HTTPException(status_code=400, detail="Invalid document ID format")
-
     # Get only set fields (exclude None values)
-    update_data = {k: v for k, v in document.model_dump().items() if v is not None}
+    update_data = document.model_dump(exclude_none=True)
 
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
 
     # Add updated_at timestamp
-    update_data["updated_at"] = datetime.utcnow()
+    update_data["updated_at"] = now
 
     # Update the document, ensuring it belongs to the authenticated user
-    result = await db.documents.update_one(
-        {"_id": ObjectId(document_id), "user_id": current_user["id"]},
-        {"$set": update_data},
+    updated_document = await db.documents.find_one_and_update(
+        {"_id": document_oid, "user_id": user_id},
+        {"$set": add_search_fields(update_data)},
+        projection=DOC_PROJECTION,
+        return_document=ReturnDocument.AFTER,
     )
 
-    if result.matched_count == 0:
+    if updated_document is None:
         raise HTTPException(
             status_code=404, detail="Document not found or unauthorized"
         )
 
-    # Get the updated document
-    updated_document = await db.documents.find_one({"_id": ObjectId(document_id)})
-
     return DocumentResponse.from_mongo(updated_document)
 
 
 @app.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_document(
-    document_id: str,
     db: AsyncIOMotorDatabase = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
+    document_oid: ObjectId = Depends(parse_object_id),
 ):
     """Delete a document for the authenticated user"""
-    if not ObjectId.is_valid(document_id):
-        raise HTTPException(status_code=400, detail="Invalid document ID format")
-
     # Delete the document, ensuring it belongs to the authenticated user
     result = await db.documents.delete_one(
-        {"_id": ObjectId(document_id), "user_id": current_user["id"]}
+        {"_id": document_oid, "user_id": user_id}
     )
 
     if result.deleted_count == 0:
@@ -140,60 +224,90 @@ async def delete_document(
     return None
 
 
-@app.get("/type/{scan_type}", response_model=List[DocumentResponse])
+@app.post("/bulk_delete")
+async def bulk_delete_documents(
+    payload: DocumentBulkDelete,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    user_id: str = Depends(get_current_user_id),
+):
+    """Delete several documents for the authenticated user in one round-trip"""
+    # Invalid IDs cannot match any document, so they are skipped
+    document_oids = [ObjectId(i) for i in payload.ids if ObjectId.is_valid(i)]
+    if not document_oids:
+        return {"deleted": 0}
+
+    # Delete only documents that belong to the authenticated user
+    result = await db.documents.delete_many(
+        {"_id": {"$in": document_oids}, "user_id": user_id}
+    )
+
+    return {"deleted": result.deleted_count}
+
+
+@app.get("/type/{scan_type}", response_model=DocumentPage)
 async def get_documents_by_type(
-    scan_type: str,
-    skip: int = 0,
-    limit: int = 10,
+    scan_type: ScanType,
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
     db: AsyncIOMotorDatabase = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
 ):
     """Get documents filtered by scan type for the authenticated user"""
-    # Validate scan type
-    valid_types = ["id", "business", "book", "document"]
-    if scan_type not in valid_types:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid scan type. Must be one of: {', '.join(valid_types)}",
-        )
-
-    documents = (
-        await db.documents.find({"scan_type": scan_type, "user_id": current_user["id"]})
-        .sort([("created_at", -1)])  # Sort by created_at in descending order
-        .skip(skip)
-        .limit(limit)
-        .to_list(length=limit)
+    return await fetch_page(
+        db, {"scan_type": scan_type, "user_id": user_id}, cursor, limit
     )
 
-    return [DocumentResponse.from_mongo(doc) for doc in documents]
-
 
-@app.get("/search/", response_model=List[DocumentResponse])
+@app.get("/search/", response_model=DocumentPage)
 async def search_documents(
-    query: str,
-    skip: int = 0,
-    limit: int = 10,
+    query: str = Query(..., min_length=1, max_length=100),
+    cursor: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
     db: AsyncIOMotorDatabase = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    user_id: str = Depends(get_current_user_id),
 ):
     """Search documents by name or other fields for the authenticated user"""
-    # Text search across multiple fields for the authenticated user
-    documents = (
-        await db.documents.find(
+    if not ATLAS_SEARCH_ENABLED:
+        # Anchored, case-sensitive prefix match on the lowercased fields can use their indexes
+        prefix = {"$regex": f"^{re.escape(query.lower())}"}
+        return await fetch_page(
+            db,
             {
-                "user_id": current_user["id"],
+                "user_id": user_id,
                 "$or": [
-                    {"document_name": {"$regex": query, "$options": "i"}},
-                    {"name": {"$regex": query, "$options": "i"}},
-                    {"book_name": {"$regex": query, "$options": "i"}},
-                    {"author_name": {"$regex": query, "$options": "i"}},
-                    {"company_name": {"$regex": query, "$options": "i"}},
+                    {shadow_field: prefix}
+                    for shadow_field in DOCUMENT_SEARCH_SHADOW_FIELDS.values()
                 ],
-            }
+            },
+            cursor,
+            limit,
         )
-        .skip(skip)
-        .limit(limit)
-        .to_list(length=limit)
-    )
 
-    return [DocumentResponse.from_mongo(doc) for doc in documents]
+    # Atlas Search: autocomplete on each field, filtered to the authenticated user
+    pipeline = [
+        {
+            "$search": {
+                "index": DOCUMENT_SEARCH_INDEX,
+                "compound": {
+                    "should": [
+                        {"autocomplete": {"query": query, "path": field}}
+                        for field in DOCUMENT_SEARCH_FIELDS
+                    ],
+                    "minimumShouldMatch": 1,
+                    "filter": [
+                        {"equals": {"path": "user_id", "value": user_id}}
+                    ],
+                },
+            }
+        }
+    ]
+    if cursor:
+        pipeline.append({"$match": decode_cursor(cursor)})
+    pipeline += [
+        {"$sort": dict(PAGE_SORT)},
+        {"$limit": limit + 1},
+        {"$project": DOC_PROJECTION},
+    ]
+
+    documents = await db.documents.aggregate(pipeline).to_list(length=limit + 1)
+    return build_page(documents, limit)
\ No newline at end of file
@@ -0,0 +1,30 @@
+import httpx
+from typing import Optional
+
+# Process-wide HTTP client for outbound OAuth calls
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def start_http_client():
+    """Create the shared HTTP client with a pooled, HTTP/2-enabled transport"""
+    global _client
+    _client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(10.0, connect=3.0),
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+    )
+
+
+async def close_http_client():
+    """Close the shared HTTP client and release its connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client"""
+    if _client is None:
+        raise RuntimeError("HTTP client has not been started")
+    return _client
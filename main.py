@@ -1,60 +1,79 @@
+import os
 import uvicorn
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from starlette.middleware.sessions import SessionMiddleware
-import secrets
-import json
+import orjson
 from bson import ObjectId
 from fastapi.responses import JSONResponse
 from typing import Any
-import os
-from dotenv import load_dotenv
+from config import settings
+from database import db_instance, redis_client
+from http_client import start_http_client, close_http_client
 from auth_routes import router as auth_router
 from document_routes import app as document_router
 
-# Load environment variables
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db_instance.create_indexes()
+    await start_http_client()
+    yield
+    await close_http_client()
+    await redis_client.aclose()
+    db_instance.close()
 
 # Initialize FastAPI app
-app = FastAPI(title="Authentication and Document API")
-
-# Generate a secure secret key for sessions
-SESSION_SECRET_KEY = os.getenv("SESSION_SECRET_KEY", secrets.token_hex(32))
+app = FastAPI(title="Authentication and Document API", lifespan=lifespan)
 
 # Add session middleware for OAuth state and user sessions
 app.add_middleware(
     SessionMiddleware,
-    secret_key=SESSION_SECRET_KEY,
+    secret_key=settings.session_secret_key,
     max_age=3600  # 1 hour session
 )
 
+# Take one wall-clock reading per request, shared by handlers via request.state.now
+class RequestTimeMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["now"] = datetime.now(timezone.utc)
+        await self.app(scope, receive, send)
+
+app.add_middleware(RequestTimeMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Set this to specific domains in production
+    allow_origins=settings.cors_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=86400,  # let browsers cache preflight responses for a day
 )
 
-# Custom JSON encoder for MongoDB ObjectId
-class MongoJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, ObjectId):
-            return str(obj)
-        return super().default(obj)
+# Compress larger responses such as document list pages
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Fallback serializer for MongoDB types orjson does not handle natively
+def mongo_json_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
 # Custom response class for MongoDB ObjectId serialization
 class MongoJSONResponse(JSONResponse):
     def render(self, content: Any) -> bytes:
-        return json.dumps(
+        return orjson.dumps(
             content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=None,
-            separators=(",", ":"),
-            cls=MongoJSONEncoder,
-        ).encode("utf-8")
+            default=mongo_json_default,
+            option=orjson.OPT_NON_STR_KEYS,
+        )
 
 # Override default JSONResponse with custom response class
 app.router.default_response_class = MongoJSONResponse
@@ -87,12 +106,16 @@ async def profile(request: Request):
 @app.get("/logout")
 async def logout(request: Request):
     request.session.pop("user", None)
-    request.session.pop("google_oauth_state", None)
-    request.session.pop("linkedin_oauth_state", None)
-    request.session.pop("facebook_oauth_state", None)
     return {"message": "Logged out successfully"}
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=os.cpu_count(),
+    )
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""
+One-off migration: store the lowercased search fields on documents written before they existed.
+
+Run once after deploying prefix search, with the same environment as the app:
+
+    python migrate_search_fields.py
+"""
+import asyncio
+from pymongo import UpdateOne
+from database import db_instance, DOCUMENT_SEARCH_SHADOW_FIELDS
+from document_routes import add_search_fields
+
+BATCH_SIZE = 1000
+
+
+async def backfill_search_fields():
+    documents_collection = db_instance.documents_collection
+    missing = {
+        "$or": [
+            {shadow_field: {"$exists": False}, field: {"$type": "string"}}
+            for field, shadow_field in DOCUMENT_SEARCH_SHADOW_FIELDS.items()
+        ]
+    }
+    projection = {field: 1 for field in DOCUMENT_SEARCH_SHADOW_FIELDS}
+
+    # Lowercase in Python with the same helper new writes use; Mongo's $toLower only folds ASCII
+    updated = 0
+    updates = []
+    async for document in documents_collection.find(missing, projection=projection):
+        lowered = add_search_fields({
+            field: document.get(field) for field in DOCUMENT_SEARCH_SHADOW_FIELDS
+        })
+        shadow_values = {
+            shadow_field: lowered[shadow_field]
+            for shadow_field in DOCUMENT_SEARCH_SHADOW_FIELDS.values()
+            if shadow_field in lowered
+        }
+        updates.append(UpdateOne({"_id": document["_id"]}, {"$set": shadow_values}))
+
+        if len(updates) >= BATCH_SIZE:
+            await documents_collection.bulk_write(updates, ordered=False)
+            updated += len(updates)
+            updates = []
+
+    if updates:
+        await documents_collection.bulk_write(updates, ordered=False)
+        updated += len(updates)
+
+    return updated
+
+
+async def main():
+    try:
+        updated = await backfill_search_fields()
+        print(f"Backfilled search fields on {updated} documents")
+    finally:
+        db_instance.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
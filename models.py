@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, Field, validator
+from pydantic import BaseModel, EmailStr, Field, create_model, field_validator
 from bson import ObjectId
-from typing import Optional, Literal, Any, Dict
+from typing import Optional, Literal, Any, Dict, List
 from datetime import datetime, timedelta
 
 class UserBase(BaseModel):
@@ -21,6 +21,23 @@ class UserResponse(UserBase):
     auth_provider: Optional[str] = None
     access_token: Optional[str] = None
 
+class UserPublic(BaseModel):
+    id: str
+    email: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+
+class UserProfile(UserPublic):
+    mobile_number: Optional[str] = None
+
+class AuthResponse(BaseModel):
+    access_token: str
+    user: UserPublic
+
+class ProfileUpdateResponse(BaseModel):
+    message: str
+    user: UserProfile
+
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
@@ -29,6 +46,7 @@ class Token(BaseModel):
     )
 
 class ResetPasswordRequest(BaseModel):
+    email: EmailStr
     otp: str
     new_password: str
     confirm_password: str
@@ -38,13 +56,14 @@ class LoginRequest(BaseModel):
     password: str
 
 # Document Models (rest of the code remains the same)
+ScanType = Literal["id", "business", "book", "document"]
+
 class Document(BaseModel):
-    id: Optional[str] = "_id"
+    id: Optional[str] = Field(default=None, validation_alias="_id")
     user_id: Optional[str] = None
     document_name: str
     is_favorite: Optional[bool] = False
-    scan_type: Literal["id", "business", "book", "document"]
-    is_favorite: Optional[bool] = False
+    scan_type: ScanType
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     
@@ -76,51 +95,35 @@ class Document(BaseModel):
         "json_encoders": {ObjectId: str, datetime: lambda dt: dt.isoformat()},
     }
 
+    @field_validator("id", mode="before")
+    @classmethod
+    def object_id_to_str(cls, v):
+        return str(v) if isinstance(v, ObjectId) else v
+
 class DocumentCreate(Document):
-    @validator("user_id")
-    def user_id_must_not_be_none(cls, v):
-        if v is None:
-            raise ValueError("user_id is required")
-        return v
-
-class DocumentUpdate(BaseModel):
-    document_name: Optional[str] = None
-    scan_type: Optional[Literal["id", "business", "book", "document"]] = None
-    is_favorite: Optional[bool] = None
-    # ID Card fields
-    name: Optional[str] = None
-    profession: Optional[str] = None
-    email: Optional[EmailStr] = None
-    mobile_number: Optional[str] = None
-    address: Optional[str] = None
-    
-    # Business Card additional fields
-    company_name: Optional[str] = None
-    website: Optional[str] = None
-    
-    # Book fields
-    isbn_no: Optional[int] = None
-    book_name: Optional[str] = None
-    author_name: Optional[str] = None
-    publication: Optional[str] = None
-    number_of_pages: Optional[int] = None
-    subject: Optional[str] = None
-    
-    # General Document fields
-    summary: Optional[str] = None
+    pass
+
+# Every user-editable Document field, optional so a PATCH-style update can send any subset
+DOCUMENT_SERVER_FIELDS = {"id", "user_id", "created_at", "updated_at"}
+DocumentUpdate = create_model(
+    "DocumentUpdate",
+    **{
+        name: (Optional[field.annotation], None)
+        for name, field in Document.model_fields.items()
+        if name not in DOCUMENT_SERVER_FIELDS
+    },
+)
 
 class DocumentResponse(Document):
     @classmethod
     def from_mongo(cls, document: Dict[str, Any]):
         """Convert MongoDB document to Pydantic model"""
-        doc_dict = {k: v for k, v in document.items()}
-        if "_id" in doc_dict:
-            doc_dict["id"] = str(doc_dict.pop("_id"))
-        
-        # Convert datetime strings to datetime objects if needed
-        if "created_at" in doc_dict and isinstance(doc_dict["created_at"], str):
-            doc_dict["created_at"] = datetime.fromisoformat(doc_dict["created_at"])
-        if "updated_at" in doc_dict and isinstance(doc_dict["updated_at"], str):
-            doc_dict["updated_at"] = datetime.fromisoformat(doc_dict["updated_at"])
-        
-        return cls(**doc_dict)
\ No newline at end of file
+        # _id is read through the field alias and ISO datetime strings are parsed by pydantic
+        return cls.model_validate(document)
+
+class DocumentPage(BaseModel):
+    items: List[DocumentResponse]
+    next_cursor: Optional[str] = None
+
+class DocumentBulkDelete(BaseModel):
+    ids: List[str] = Field(min_length=1, max_length=100)
\ No newline at end of file